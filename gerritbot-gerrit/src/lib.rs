@@ -326,6 +326,11 @@ impl CommandRunner {
                     connection_healthy = true;
                 }
 
+                // Every command gets a fresh channel: an exec channel can only
+                // run a single command, and keeping pre-opened channels around
+                // would borrow the session across reconnects. All channels are
+                // multiplexed over the same transport, so this costs one
+                // channel-open round trip, not a new connection.
                 let mut ssh_channel = match connection.session.channel_session() {
                     Ok(channel) => channel,
                     Err(e) => {
@@ -346,13 +351,28 @@ impl CommandRunner {
                     break Err(format!("failed to read from channel: {}", e));
                 }
 
+                // Drain stderr as well, so it can be logged if the command
+                // fails. It is only used for diagnostics: a read error or
+                // invalid UTF-8 must not fail an otherwise successful command.
+                let mut error_data = Vec::new();
+
+                if let Err(e) = ssh_channel.stderr().read_to_end(&mut error_data) {
+                    debug!("failed to read stderr from channel: {}", e);
+                }
+
                 match ssh_channel
                     .close()
                     .and_then(|()| ssh_channel.wait_close())
                     .and_then(|()| ssh_channel.exit_status())
                 {
                     Ok(0) => break Ok(data),
-                    Ok(i) => break Err(format!("command exited with status {}", i)),
+                    Ok(i) => {
+                        debug!(
+                            "command stderr: {}",
+                            String::from_utf8_lossy(&error_data).trim_end()
+                        );
+                        break Err(format!("command exited with status {}", i));
+                    }
                     Err(e) => break Err(format!("failed to close command channel: {}", e)),
                 }
             };
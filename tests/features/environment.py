@@ -1,5 +1,3 @@
-import os
-
 from behave import use_fixture
 
 from gerritbot_behave.gerrit import setup_gerrit
@@ -51,6 +49,7 @@ def before_all(context):
     context.gerrit.create_account(context.bot_user)
     context.gerrit.add_user_to_group(context.bot_user, "Non-Interactive+Users")
     context.urls = URLs(context)
+    context.accounts = Accounts()
 
 
 def before_scenario(context, scenario):
@@ -64,4 +63,5 @@ def before_scenario(context, scenario):
         executable=context.gerritbot_executable,
     )
 
-    context.accounts = Accounts()
+    context.accounts.clear()
+    context.urls.users.clear()
@@ -1,40 +1,93 @@
-import os
-import hashlib
+import functools
 import paramiko
-from binascii import hexlify
+import sys
+
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from secrets import token_hex
+
+from requests.auth import HTTPBasicAuth
+
+
+@functools.lru_cache(maxsize=128)
+def account_key(name):
+    # steps look up the same few names over and over again; interned keys
+    # match the interned usernames in the account dicts by identity
+    return sys.intern(name.lower())
 
 
 class Account:
+    __slots__ = (
+        "fullname",
+        "username",
+        "http_password",
+        "http_auth",
+        "ssh_key",
+        "ssh_public_key",
+        "account_input",
+    )
+
     def __init__(self, *, fullname, username):
         self.fullname = fullname
-        self.username = username
-        self.http_password = hexlify(os.urandom(16)).decode("ascii")
-        self.ssh_key = paramiko.RSAKey.generate(1024)
+        self.username = sys.intern(username)
+        self.http_password = token_hex(16)
+        self.http_auth = HTTPBasicAuth(self.username, self.http_password)
+        self.ssh_key = self.generate_ssh_key()
+        # public key in authorized_keys format
+        self.ssh_public_key = f"{self.ssh_key.get_name()} {self.ssh_key.get_base64()}"
+        # AccountInput for creating the account via the Gerrit REST API
+        self.account_input = {
+            "name": self.fullname,
+            "ssh_key": self.ssh_public_key,
+            "http_password": self.http_password,
+        }
+
+    @staticmethod
+    def generate_ssh_key():
+        return paramiko.RSAKey.generate(1024)
 
 
 class Person(Account):
+    __slots__ = ("email",)
+
     def __init__(self, name, email):
         super().__init__(fullname=name, username=name.split(None, 1)[0].lower())
         self.email = email
+        self.account_input["email"] = email
+
+    @staticmethod
+    def generate_ssh_key():
+        # Persons never log in via SSH, their keys are only uploaded to Gerrit.
+        # Use ECDSA which is much cheaper to generate than RSA. The bot keeps
+        # an RSA key since it has to authenticate through libssh2.
+        return paramiko.ECDSAKey.generate()
 
 
 class Bot(Account):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(fullname=name, username=name.lower())
 
 
 class Accounts:
+    __slots__ = ("persons", "bots", "accounts")
+
     def __init__(self):
-        self.accounts = {}
+        self.persons = {}
+        self.bots = {}
+        self.accounts = ChainMap(self.persons, self.bots)
+
+    def clear(self):
+        self.persons.clear()
+        self.bots.clear()
 
     def all_persons(self):
-        return [
-            account for account in self.accounts.values() if isinstance(account, Person)
-        ]
+        return list(self.persons.values())
 
     def get_account(self, name, *, expected_type=None):
         try:
-            account = self.accounts[name.lower()]
+            account = self.accounts[account_key(name)]
         except LookupError:
             raise ValueError(f"account named {name} doesn't exist")
 
@@ -46,13 +99,20 @@ class Accounts:
             )
 
     def get_person(self, name):
-        return self.get_account(name, expected_type=Person)
+        try:
+            return self.persons[account_key(name)]
+        except LookupError:
+            # not a person, let get_account raise the appropriate error
+            return self.get_account(name, expected_type=Person)
 
     def add_account(self, account):
         if account.username in self.accounts:
             raise ValueError(f"account {account.username} already exists")
 
-        self.accounts[account.username] = account
+        if isinstance(account, Person):
+            self.persons[account.username] = account
+        else:
+            self.bots[account.username] = account
 
     def create_bot(self, name):
         account = Bot(name)
@@ -63,3 +123,13 @@ class Accounts:
         account = Person(name, email)
         self.add_account(account)
         return account
+
+    def create_persons(self, persons):
+        # generating the SSH keys is the expensive part, do it concurrently
+        with ThreadPoolExecutor() as executor:
+            accounts = list(executor.map(lambda person: Person(*person), persons))
+
+        for account in accounts:
+            self.add_account(account)
+
+        return accounts
@@ -1,29 +1,56 @@
+import collections
+import io
 import json
 import logging
 import os
-import queue
 import subprocess
 import tempfile
 import threading
 
 from behave import fixture
 
+# use orjson for the bot messages if it is available
+try:
+    import orjson
+except ImportError:
+
+    def dump_message(message):
+        return json.dumps(message).encode("utf-8")
+
+    load_message = json.loads
+else:
+    dump_message = orjson.dumps
+    load_message = orjson.loads
+
+# read buffer size for the bot's stdout and stderr
+PIPE_BUFFER_SIZE = 1 << 16
+
 
 class BotHandler:
-    def __init__(self, *, process, message_queue, message_timeout):
+    def __init__(self, *, process, message_timeout):
         self.process = process
-        self.message_queue = message_queue
         self.message_timeout = message_timeout
+        # Messages read from the bot, the event is set whenever new messages
+        # were added. There is exactly one producer and one consumer and deque
+        # appends and pops are atomic, so no additional lock is needed.
+        self.message_buffer = collections.deque()
+        self.message_event = threading.Event()
 
     def send_message(self, sender, message):
+        self.broadcast_message([sender], message)
+
+    def broadcast_message(self, senders, message):
         log = logging.getLogger("bot-messages")
-        serialized_message = json.dumps(
-            {"email": sender.email, "text": message}
-        ).encode("utf-8")
-        log.debug("sending message to bot: %r", serialized_message)
-        self.process.stdin.write(serialized_message)
-        self.process.stdin.write(b"\n")
-        self.process.stdin.flush()
+        serialized_messages = b"".join(
+            dump_message({"email": sender.email, "text": message}) + b"\n"
+            for sender in senders
+        )
+        log.debug("sending messages to bot: %r", serialized_messages)
+
+        # stdin is a raw pipe, a single write might only take part of the data
+        view = memoryview(serialized_messages)
+        while view:
+            view = view[self.process.stdin.write(view) :]
 
     def get_messages(self):
         messages = []
@@ -31,12 +58,16 @@ class BotHandler:
         while True:
             # XXX: we should find a better way to check if there are no more
             # messages coming
-            try:
-                message = self.message_queue.get(timeout=self.message_timeout)
-            except queue.Empty:
+            if not self.message_event.wait(timeout=self.message_timeout):
                 break
-            else:
-                messages.append(message)
+
+            # clear before draining: anything appended afterwards sets the
+            # event again and is picked up in the next iteration
+            self.message_event.clear()
+            popleft = self.message_buffer.popleft
+
+            while self.message_buffer:
+                messages.append(popleft())
 
         self.current_messages = messages
         return messages
@@ -49,14 +80,19 @@ class BotHandler:
 
         log.debug("starting to read messages from bot")
 
-        for line in self.process.stdout:
+        loads = load_message
+
+        # one message per line, hand each one over as soon as it is complete
+        for line in iter(self.process.stdout.readline, b""):
             try:
-                message = json.loads(line)
+                message = loads(line)
             except:
                 log.exception("failed to parse JSON message: %s", line)
             else:
                 log.debug("got bot message: %r", message)
-                self.message_queue.put(message)
+
+                self.message_buffer.append(message)
+                self.message_event.set()
 
     def _read_logs(self):
         log = logging.getLogger("bot-log")
@@ -64,11 +100,13 @@ class BotHandler:
         # XXX: try to parse log level from bot output
 
         for line in self.process.stderr:
-            log.info("%s", line.decode("utf-8").rstrip("\n"))
+            log.info("%s", line.rstrip("\n"))
 
 
 def build_bot():
-    subprocess.check_call(["cargo", "build", "--example", "gerritbot-console"])
+    subprocess.check_call(
+        ["cargo", "build", "--release", "--example", "gerritbot-console"]
+    )
     metadata = json.loads(
         subprocess.check_output(
             ["cargo", "metadata", "--no-deps", "--format-version=1"]
@@ -76,7 +114,7 @@ def build_bot():
     )
     target_directory = metadata["target_directory"]
 
-    return os.path.join(target_directory, "debug", "examples", "gerritbot-console")
+    return os.path.join(target_directory, "release", "examples", "gerritbot-console")
 
 
 @fixture
@@ -84,7 +122,7 @@ def setup_bot(context, *, user, hostname, port, message_timeout, executable):
     with tempfile.TemporaryDirectory() as bot_directory:
         user.ssh_key.write_private_key_file(os.path.join(bot_directory, "id_rsa"))
         with open(os.path.join(bot_directory, "id_rsa.pub"), "w") as f:
-            f.write(f"{user.ssh_key.get_name()} {user.ssh_key.get_base64()}")
+            f.write(user.ssh_public_key)
 
         bot_args = [
             executable,
@@ -107,20 +145,30 @@ def setup_bot(context, *, user, hostname, port, message_timeout, executable):
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        # stdin is unbuffered so that messages reach the bot without an extra
+        # flush. Writes to it are single syscalls which may be short, so
+        # BotHandler writes in a loop until all data is sent. The output pipes
+        # are read line by line and get their own buffers, large enough to
+        # take bursts of output in a single read.
+        # stderr only carries log lines, decode them while reading.
+        bot_process.stdout = io.BufferedReader(
+            bot_process.stdout, buffer_size=PIPE_BUFFER_SIZE
+        )
+        bot_process.stderr = io.TextIOWrapper(
+            io.BufferedReader(bot_process.stderr, buffer_size=PIPE_BUFFER_SIZE),
+            encoding="utf-8",
         )
 
-        # Using cargo run above means we might actually be compiling still.
-        # Wait for the bot to be ready.
+        # The executable was built once in before_all, but the bot still needs
+        # to connect to Gerrit. Wait for it to be ready.
         for line in bot_process.stderr:
-            if b"Connected to Gerrit" in line:
+            if "Connected to Gerrit" in line:
                 break
 
-        message_queue = queue.Queue()
-
         bot = context.bot = BotHandler(
-            process=bot_process,
-            message_queue=message_queue,
-            message_timeout=message_timeout,
+            process=bot_process, message_timeout=message_timeout
         )
         read_messages_thread = threading.Thread(target=bot._read_messages)
         read_messages_thread.start()
@@ -16,8 +16,20 @@ class ProjectURLs(URLsBase):
 
 
 class UserURLs(URLsBase):
+    def __init__(self, context):
+        super().__init__(context)
+        self._user_urls = {}
+
+    def clear(self):
+        # the URLs contain the persons' emails, which are per scenario
+        self._user_urls.clear()
+
     def __getitem__(self, username):
-        return UserURL(self.context, username)
+        try:
+            return self._user_urls[username]
+        except KeyError:
+            url = self._user_urls[username] = UserURL(self.context, username)
+            return url
 
 
 class UserURL:
@@ -25,13 +37,24 @@ class UserURL:
         self.context = context
         self.username = username
         self.role = role
+        self._url = None
+        self._role_urls = {}
 
     def __str__(self):
-        email = self.context.accounts.get_person(self.username).email
-        return f"{self.context.gerrit_http_url}/q/{self.role}:{email}+status:open"
+        if self._url is None:
+            email = self.context.accounts.get_person(self.username).email
+            self._url = (
+                f"{self.context.gerrit_http_url}/q/{self.role}:{email}+status:open"
+            )
+
+        return self._url
 
     def __getattr__(self, role):
-        return type(self)(self.context, self.username, role)
+        try:
+            return self._role_urls[role]
+        except KeyError:
+            url = self._role_urls[role] = type(self)(self.context, self.username, role)
+            return url
 
 
 class ChangeURLs(URLsBase):
@@ -1,14 +1,26 @@
+import collections
 import itertools
 import json
-import os
 import time
 
-from urllib.parse import urljoin
-from binascii import hexlify
+from concurrent.futures import ThreadPoolExecutor
 
 from behave import fixture
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+# use orjson to parse responses if it is available
+try:
+    from orjson import loads as load_json
+except ImportError:
+    load_json = json.loads
+
+# Gerrit prefixes JSON responses with this line to prevent XSSI
+XSSI_PREFIX = b")]}'\n"
+
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 
 class AlreadyExistsError(requests.HTTPError):
@@ -21,33 +33,64 @@ class GerritHandler:
     ):
         self.admin_username = admin_username
         self.admin_password = admin_password
+        self.admin_auth = HTTPBasicAuth(admin_username, admin_password)
         self.http_url = http_url
         self.groups = []
         self.projects = []
         self.users = []
         self.changes = []
+        self.last_change_by_user = {}
+        # usernames known to be members of each group
+        self.group_members = collections.defaultdict(set)
+
+        # share one connection pool between all requests to avoid a new
+        # connection per request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.api_url = self.http_url.rstrip("/") + "/a/"
+
+        # used to run independent requests (e.g. group membership updates)
+        # concurrently
+        self.executor = ThreadPoolExecutor(max_workers=8)
 
     @staticmethod
-    def parse_json_response(text):
+    def parse_json_response(content):
         # Gerrit inserts non-json symbols into the first line
-        return json.loads(text.partition("\n")[2])
+        if content.startswith(XSSI_PREFIX):
+            return load_json(content[len(XSSI_PREFIX) :])
+        else:
+            return load_json(content.partition(b"\n")[2])
 
     def http_request(self, request_method, url, *, user, **kwds):
+        # url is a REST API endpoint path and gets appended to self.api_url
+        assert "://" not in url, f"expected an API path, got {url}"
+
         if user == "admin":
-            auth = (self.admin_username, self.admin_password)
+            auth = self.admin_auth
         else:
-            auth = (user.username, user.http_password)
-        r = request_method(
-            urljoin(urljoin(self.http_url, "a/"), url.lstrip("/")), auth=auth, **kwds
+            auth = user.http_auth
+
+        json_data = kwds.pop("json", None)
+        if json_data is not None:
+            kwds["data"] = json.dumps(json_data).encode("utf-8")
+            headers = kwds.get("headers")
+            kwds["headers"] = (
+                JSON_HEADERS if headers is None else {**headers, **JSON_HEADERS}
+            )
+
+        r = self.session.request(
+            request_method, self.api_url + url.lstrip("/"), auth=auth, **kwds
         )
         r.raise_for_status()
 
         if r.status_code != requests.codes.no_content:
-            return self.parse_json_response(r.text)
+            return self.parse_json_response(r.content)
 
     def http_put(self, *args, **kwds):
         try:
-            return self.http_request(requests.put, *args, **kwds)
+            return self.http_request("PUT", *args, **kwds)
         except requests.HTTPError as e:
             if e.response.status_code == requests.codes.conflict:
                 e.__class__ = AlreadyExistsError
@@ -55,13 +98,14 @@ class GerritHandler:
             raise e
 
     def http_post(self, *args, **kwds):
-        return self.http_request(requests.post, *args, **kwds)
+        return self.http_request("POST", *args, **kwds)
 
     def cleanup(self):
         # TODO: delete created changes, users, projects
         # TODO: also add an option not to delete anything
         # XXX: probably users cannot be deleted, maybe a workaround is necessary
-        pass
+        self.executor.shutdown()
+        self.session.close()
 
     def create_group(self, group_name):
         try:
@@ -73,13 +117,45 @@ class GerritHandler:
         self.groups.append((group_name, created))
 
     def add_user_to_group(self, user, group_name):
+        members = self.group_members[group_name]
+
+        if user.username in members:
+            return
+
         self.http_put(f"/groups/{group_name}/members/{user.username}", user="admin")
+        members.add(user.username)
+
+    def add_users_to_group(self, users, group_name):
+        members = self.group_members[group_name]
+        new_members = list(
+            dict.fromkeys(
+                user.username for user in users if user.username not in members
+            )
+        )
+
+        if not new_members:
+            return
+
+        self.http_post(
+            f"/groups/{group_name}/members.add",
+            user="admin",
+            json={"members": new_members},
+        )
+        members.update(new_members)
 
     def create_project(self, project_name):
         project_group = project_name + "-owners"
 
         self.create_group(project_group)
 
+        # once the group exists, creating the project and adding the members
+        # are independent of each other
+        members_added = self.executor.submit(
+            self.add_users_to_group,
+            [user for (user, created) in self.users],
+            project_group,
+        )
+
         try:
             self.http_put(
                 f"/projects/{project_name}",
@@ -90,28 +166,15 @@ class GerritHandler:
         except AlreadyExistsError:
             created = False
 
+        members_added.result()
         self.projects.append((project_name, project_group, created))
 
-        for (person, created) in self.users:
-            self.add_user_to_group(person, project_group)
-
-    def create_account(self, account):
-        created = False
-
+    def put_account(self, account):
         try:
-            account_input = {
-                "name": account.fullname,
-                "ssh_key": f"{account.ssh_key.get_name()} {account.ssh_key.get_base64()}",
-                "http_password": account.http_password,
-            }
-
-            try:
-                account_input["email"] = account.email
-            except AttributeError:
-                pass
-
             self.http_put(
-                f"/accounts/{account.username}", user="admin", json=account_input
+                f"/accounts/{account.username}",
+                user="admin",
+                json=account.account_input,
             )
         except AlreadyExistsError:
             self.http_put(
@@ -123,15 +186,33 @@ class GerritHandler:
                 f"/accounts/{account.username}/sshkeys",
                 user="admin",
                 headers={"content_type": "text/plain"},
-                data=f"{account.ssh_key.get_name()} {account.ssh_key.get_base64()}",
+                data=account.ssh_public_key,
             )
+            return False
         else:
-            created = True
-
-        self.users.append((account, created))
+            return True
 
-        for (project_name, project_group, created) in self.projects:
-            self.add_user_to_group(account, project_group)
+    def create_account(self, account):
+        self.create_accounts([account])
+
+    def create_accounts(self, accounts):
+        # Gerrit has no bulk account creation, but the accounts are
+        # independent of each other and share the session's connection pool
+        created = list(self.executor.map(self.put_account, accounts))
+        self.users.extend(zip(accounts, created))
+
+        # members.add only takes a single group, so this is still one request
+        # per project group, but it adds all accounts at once and the groups
+        # are handled concurrently
+        project_groups = dict.fromkeys(
+            project_group for (_, project_group, _) in self.projects
+        )
+        list(
+            self.executor.map(
+                lambda project_group: self.add_users_to_group(accounts, project_group),
+                project_groups,
+            )
+        )
 
     def create_new_change(self, uploader, project_name):
         change_info = self.http_post(
@@ -145,6 +226,7 @@ class GerritHandler:
             user=uploader,
         )
         self.changes.append((uploader, change_info, True))
+        self.last_change_by_user[uploader.username] = change_info
         return change_info
 
     def add_file_to_change(self, uploader, change_info, filename, content):
@@ -157,14 +239,8 @@ class GerritHandler:
 
     def get_last_change_by(self, uploader):
         try:
-            return next(
-                (
-                    change_info
-                    for (user, change_info, created) in reversed(self.changes)
-                    if user.username == uploader.username
-                )
-            )
-        except StopIteration:
+            return self.last_change_by_user[uploader.username]
+        except KeyError:
             raise ValueError(f"failed to find change by {uploader.username}")
 
     def reply(self, change, reviewer, *, message=None, labels=None, comments=None):
@@ -217,13 +293,29 @@ def setup_gerrit(
 ):
     # TODO: support running gerrit container from here
 
+    context.gerrit = GerritHandler(
+        ssh_hostname=ssh_hostname,
+        ssh_port=ssh_port,
+        http_url=http_url,
+        admin_username=admin_username,
+        admin_password=admin_password,
+    )
+    session = context.gerrit.session
+
     if gerrit_start_timeout is not None:
         t0 = time.monotonic()
 
         for i in itertools.count():
             try:
-                requests.get(http_url).raise_for_status()
-            except requests.ConnectionError:
+                r = session.head(http_url, allow_redirects=False, timeout=1.0)
+
+                # a login wall still means the server is up
+                if r.status_code not in (
+                    requests.codes.unauthorized,
+                    requests.codes.forbidden,
+                ):
+                    r.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout):
                 current_wait_time = time.monotonic() - t0
 
                 if current_wait_time > gerrit_start_timeout:
@@ -234,20 +326,13 @@ def setup_gerrit(
                     elif i % 10 == 0:
                         print(f"Still waiting after {current_wait_time:.2f}s ...")
 
-                    time.sleep(0.5)
+                    # back off exponentially from 50ms up to 0.5s
+                    time.sleep(min(0.05 * 2 ** min(i, 4), 0.5))
             else:
                 if i != 0:
                     current_wait_time = time.monotonic() - t0
                     print(f"Gerrit up after {current_wait_time:.2f}s seconds")
                 break
 
-    context.gerrit = GerritHandler(
-        ssh_hostname=ssh_hostname,
-        ssh_port=ssh_port,
-        http_url=http_url,
-        admin_username=admin_username,
-        admin_password=admin_password,
-    )
-
     yield
     context.gerrit.cleanup()
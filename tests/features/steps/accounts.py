@@ -12,7 +12,7 @@ def step_impl(context, name):
 
 @given("the following persons")
 def step_impl(context):
-    for row in context.table:
-        context.execute_steps(
-            f"given a person named {row['name']} with email address {row['email']}"
-        )
+    accounts = context.accounts.create_persons(
+        (row["name"], row["email"]) for row in context.table
+    )
+    context.gerrit.create_accounts(accounts)
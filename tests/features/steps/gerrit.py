@@ -1,14 +1,16 @@
 import re
 
-LABEL_RE = re.compile(r"(?P<label_name>.*)(?P<label_value>[+-]\d+)")
+INLINE_COMMENT_RE = re.compile(r"^(?:Line (\d+): (.*)|File: (.*))$", re.MULTILINE)
+
+use_step_matcher("re")
 
 
-@given("a Gerrit project named {project_name}")
+@given("a Gerrit project named (?P<project_name>.+)")
 def step_impl(context, project_name):
     context.gerrit.create_project(project_name)
 
 
-@given("{uploader} uploads a new change to the {project_name} project")
+@given("(?P<uploader>.+?) uploads a new change to the (?P<project_name>.+?) project")
 def step_impl(context, uploader, project_name):
     uploader = context.accounts.get_person(uploader)
     context.last_created_change = context.gerrit.create_new_change(
@@ -17,7 +19,8 @@ def step_impl(context, uploader, project_name):
 
 
 @given(
-    '{uploader} creates the file "{filename}" with the following content in the change'
+    '(?P<uploader>.+?) creates the file "(?P<filename>.+?)" '
+    "with the following content in the change"
 )
 def step_impl(context, uploader, filename):
     uploader = context.accounts.get_person(uploader)
@@ -26,7 +29,7 @@ def step_impl(context, uploader, filename):
     )
 
 
-@given("{actor} adds {reviewer} as reviewer to {owner}'s change")
+@given("(?P<actor>.+?) adds (?P<reviewer>.+?) as reviewer to (?P<owner>.+?)'s change")
 def step_impl(context, actor, reviewer, owner):
     actor = context.accounts.get_person(actor)
     reviewer = context.accounts.get_person(reviewer)
@@ -35,9 +38,6 @@ def step_impl(context, actor, reviewer, owner):
     context.gerrit.add_reviewer(change, reviewer=reviewer, user=actor)
 
 
-use_step_matcher("re")
-
-
 @given("(?P<actor>.*) submits (?:(?P<owner>.*)'s|the) change")
 def step_impl(context, actor, owner):
     actor = context.accounts.get_person(actor)
@@ -68,49 +68,34 @@ def step_impl(context, actor, owner, comment):
 
 
 def parse_inline_comments(s):
+    # File: lines alone don't produce any comments
+    if "Line " not in s:
+        return {}
+
     inline_comments = {}
     filename = None
-    for m in re.finditer(
-        r"(^Line (?P<line>\d+): (?P<comment>.*)|File: (?P<filename>.*))$",
-        s,
-        re.MULTILINE,
-    ):
-        next_filename, line_number_str, line_comment = m.group(
-            "filename", "line", "comment"
-        )
-
-        if next_filename is not None:
-            filename = next_filename
-        else:
-            line_number = int(line_number_str)
+    for line_number, line_comment, next_filename in INLINE_COMMENT_RE.findall(s):
+        if line_number:
             inline_comments.setdefault(filename, []).append(
-                {"line": line_number, "message": line_comment}
+                {"line": int(line_number), "message": line_comment}
             )
+        else:
+            filename = next_filename
 
     return inline_comments
 
 
-@given(
-    "(?P<reviewer>.*) replies to (?:(?P<uploader>.*)'s|the) change with "
-    "(?:(?P<label_name>[^ ]*)(?P<label_value>[+-]\d+))?"
-    "(?: and )?"
-    '(?:the comment "(?P<comment>.*)")?'
-    "(?: and )?"
-    "(?:"
-    "(?P<has_inline_comments>the following inline comments)"
-    "|"
-    "(?P<has_multiline_comment>the following comment)"
-    ")?"
+REPLY_PREFIX = "(?P<reviewer>.*) replies to (?:(?P<uploader>.*)'s|the) change with "
+# a dash followed by a letter continues the label name, one followed by a
+# digit starts the value, so the name never has to be backtracked into
+REPLY_LABEL = (
+    r"(?P<label_name>[A-Za-z0-9]+(?:-[A-Za-z][A-Za-z0-9]*)*)(?P<label_value>[+-]\d+)"
 )
-def step_impl(
-    context,
-    reviewer,
-    uploader,
-    label_name,
-    label_value,
-    comment,
-    has_inline_comments,
-    has_multiline_comment,
+REPLY_COMMENT = 'the comment "(?P<comment>.*)"'
+
+
+def reply_to_change(
+    context, reviewer, uploader, label_name, label_value, comment, inline_comments=None
 ):
     reviewer = context.accounts.get_account(reviewer)
 
@@ -126,17 +111,42 @@ def step_impl(
     else:
         labels = None
 
+    context.gerrit.reply(
+        change, reviewer, labels=labels, message=comment, comments=inline_comments
+    )
+
+
+@given(
+    REPLY_PREFIX
+    + f"(?:{REPLY_LABEL} and )?"
+    + f"(?:{REPLY_COMMENT} and )?"
+    + "the following "
+    + "(?:(?P<has_inline_comments>inline comments)|comment)"
+)
+def step_impl(
+    context, reviewer, uploader, label_name, label_value, comment, has_inline_comments
+):
     if has_inline_comments:
         inline_comments = parse_inline_comments(context.text)
     else:
         inline_comments = None
 
-    if has_multiline_comment:
         if comment is not None:
             comment += "\n" + context.text
         else:
             comment = context.text
 
-    context.gerrit.reply(
-        change, reviewer, labels=labels, message=comment, comments=inline_comments
+    reply_to_change(
+        context,
+        reviewer,
+        uploader,
+        label_name,
+        label_value,
+        comment,
+        inline_comments=inline_comments,
     )
+
+
+@given(REPLY_PREFIX + f"(?:{REPLY_LABEL})?(?: and )?(?:{REPLY_COMMENT})?")
+def step_impl(context, reviewer, uploader, label_name, label_value, comment):
+    reply_to_change(context, reviewer, uploader, label_name, label_value, comment)